@@ -1,38 +1,144 @@
 # 2_analytics_and_insights.py
 # Fresco Retail — Analytics & Insights
 
+import os
+from math import ceil
+
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 
 st.set_page_config(page_title="Analytics & Insights", layout="wide")
 
-default_path = "data/Fresco_Retailerr.xlsx"
+default_path = "data/Fresco_Retailerr.parquet"
+excel_path = "data/Fresco_Retailerr.xlsx"
+
+# Union of every column spelling the page can reference (the first_col
+# candidate lists below). Anything outside this set never leaves disk.
+NEEDED_COLS = [
+    "Return", "return", "is_return", "Is_Return",
+    "Payment_mode", "payment_mode", "Payment Method", "PaymentMethod",
+    "Store_type", "store_type", "Store Type", "Store",
+    "Income", "income", "Annual_Income", "Annual Income",
+    "product_category", "Product_category", "Product Category", "Category",
+    "Product_Subcategory", "product_subcategory", "Product Subcategory", "Subcategory",
+    "Reviews", "reviews", "Customer_Reviews", "Rating",
+    "Tax", "tax", "Tax_Amount", "TaxAmount",
+]
 
 # ========== DATA HELPERS ==========
 
+@st.cache_resource
+def _ensure_parquet(parquet_path=default_path, source_path=excel_path):
+    # One-time bootstrap: convert the Excel source if the Parquet copy is
+    # missing (e.g. a fresh checkout with a replaced dataset).
+    if not os.path.exists(parquet_path):
+        # sheet_name=0 parses just the data sheet instead of the whole
+        # workbook. Columns are kept intact — the Parquet copy is shared
+        # with the Project Information page, which shows all of them;
+        # load_data prunes to NEEDED_COLS at read time anyway.
+        pd.read_excel(source_path, sheet_name=0).to_parquet(parquet_path, engine="pyarrow")
+    return parquet_path
+
+
 @st.cache_data
 def load_data(path=default_path):
-    df = pd.read_excel(path)
+    import pyarrow.parquet as pq
+
+    _ensure_parquet(path)
+    # Memory-mapped columnar read of just the columns the page uses — no
+    # XML parsing and no bytes moved for unused columns.
+    schema_names = set(pq.ParquetFile(path).schema.names)
+    cols = [c for c in NEEDED_COLS if c in schema_names]
+    df = pq.read_table(path, columns=cols or None, memory_map=True).to_pandas(
+        types_mapper=pd.ArrowDtype
+    )
     df.columns = [c.strip().replace(" ", "_") for c in df.columns]
+    # Low-cardinality group keys become category so groupby hashes small
+    # int codes instead of strings. Every groupby below passes
+    # observed=True to stay on the code path and skip unused categories.
+    for c in ("Payment_mode", "Store_type", "product_category", "Product_Subcategory"):
+        if c in df.columns and len(df) and df[c].nunique() / len(df) < 0.05:
+            df[c] = df[c].astype("category")
+    # Return is a 0/1 indicator — a uint8 streams an eighth of the bytes
+    # of int64 through every aggregation; Income/Tax only need fp32.
+    if "Return" in df.columns:
+        df["Return"] = pd.to_numeric(df["Return"], downcast="unsigned").astype("uint8")
+    for c in ("Income", "Tax"):
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], downcast="float")
     return df
 
 
+# numba fuses the bucketizers' coerce + branch into one parallel pass over
+# the raw array — worthwhile on multi-million-row frames. The page works
+# without it; the vectorized numpy path below is the fallback.
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+BUCKET_LABELS = ["Low", "Medium", "High", "Unknown"]
+
+if njit is not None:
+
+    @njit(parallel=True, cache=True)
+    def _review_codes(x):
+        out = np.empty(x.size, np.int8)
+        for i in prange(x.size):
+            v = x[i]
+            if v != v:
+                out[i] = 3
+            elif v <= 2:
+                out[i] = 0
+            elif v == 3:
+                out[i] = 1
+            else:
+                out[i] = 2
+        return out
+
+    @njit(parallel=True, cache=True)
+    def _tax_codes(x):
+        out = np.empty(x.size, np.int8)
+        for i in prange(x.size):
+            v = x[i]
+            if v != v:
+                out[i] = 3
+            elif v <= 95.76:
+                out[i] = 0
+            elif v <= 349.97:
+                out[i] = 1
+            else:
+                out[i] = 2
+        return out
+
+
 def ensure_review_level(df, reviews_col):
     if "Review_Level" in df.columns:
         return df
-    def categorize_review(x):
-        try:
-            x = float(x)
-        except Exception:
-            return "Unknown"
-        if x <= 2:
-            return "Low"
-        elif x == 3:
-            return "Medium"
-        else:
-            return "High"
-    df["Review_Level"] = df[reviews_col].apply(categorize_review)
+    # Single vectorized pass instead of a Python callback per row; the
+    # Low/Medium/High/Unknown mapping is unchanged. Comparisons run on a
+    # plain float array — Arrow-backed columns produce masked bool[pyarrow]
+    # results that np.select rejects.
+    vals = pd.to_numeric(df[reviews_col], errors="coerce")
+    arr = vals.to_numpy(dtype=np.float64, na_value=np.nan)
+    if njit is not None:
+        codes = _review_codes(arr)
+        df["Review_Level"] = pd.Categorical.from_codes(codes, BUCKET_LABELS)
+    else:
+        # Same Categorical dtype as the numba path, so downstream sorts
+        # order the buckets identically with or without numba installed.
+        df["Review_Level"] = pd.Categorical(
+            np.select(
+                [arr <= 2, arr == 3, ~np.isnan(arr)],
+                ["Low", "Medium", "High"],
+                default="Unknown",
+            ),
+            categories=BUCKET_LABELS,
+        )
     return df
 
 
@@ -48,30 +154,110 @@ def ensure_income_category(df, income_col):
 def ensure_tax_level(df, tax_col):
     if "Tax_Level" in df.columns:
         return df
-    def map_tax(x):
-        try:
-            x = float(x)
-        except Exception:
-            return "Unknown"
-        if x <= 95.76:
-            return "Low"
-        elif x <= 349.97:
-            return "Medium"
-        else:
-            return "High"
-    df["Tax_Level"] = df[tax_col].apply(map_tax)
+    vals = pd.to_numeric(df[tax_col], errors="coerce")
+    arr = vals.to_numpy(dtype=np.float64, na_value=np.nan)
+    if njit is not None:
+        codes = _tax_codes(arr)
+        df["Tax_Level"] = pd.Categorical.from_codes(codes, BUCKET_LABELS)
+    else:
+        df["Tax_Level"] = pd.Categorical(
+            np.select(
+                [arr <= 95.76, arr <= 349.97, ~np.isnan(arr)],
+                ["Low", "Medium", "High"],
+                default="Unknown",
+            ),
+            categories=BUCKET_LABELS,
+        )
     return df
 
 
-def first_col(df, candidates):
-    for c in candidates:
-        if c in df.columns:
-            return c
-    return None
+def first_col(columns, candidates):
+    # Callers pass a prebuilt set of column names so each candidate check
+    # is a single hash lookup; a DataFrame still works for convenience.
+    cols = columns if isinstance(columns, set) else set(columns.columns)
+    return next((c for c in candidates if c in cols), None)
+
+
+# Derive the bucketed columns once behind the cache: re-selecting a sidebar
+# question becomes a cache lookup instead of a fresh copy plus a Python
+# row-loop over the whole frame.
+@st.cache_data
+def prepare_data(path=default_path):
+    df = load_data(path)
+    cols = set(df.columns)
+    reviews_col = first_col(cols, ["Reviews", "reviews", "Customer_Reviews", "Rating"])
+    income_col  = first_col(cols, ["Income", "income", "Annual_Income", "Annual Income"])
+    tax_col     = first_col(cols, ["Tax", "tax", "Tax_Amount", "TaxAmount"])
+    if reviews_col:
+        df = ensure_review_level(df, reviews_col)
+    if income_col:
+        df = ensure_income_category(df, income_col)
+    if tax_col:
+        df = ensure_tax_level(df, tax_col)
+    subcat_col = first_col(cols, ["Product_Subcategory", "product_subcategory", "Product Subcategory", "Subcategory"])
+    if subcat_col:
+        # One substring scan at load time ("wom" subsumes "women";
+        # regex=False takes the C fast path) instead of two regex passes
+        # per rerun in the Women's-products branch.
+        df["is_women"] = (
+            df[subcat_col].astype("string").str.contains("wom", case=False, na=False, regex=False)
+        )
+    return df
+
+
+def mean_by(df, key, value_col):
+    # Single-key mean via factorize + bincount: two tight C passes over
+    # int codes, skipping groupby's dispatch and index machinery.
+    # sort=True keeps the row order groupby produced.
+    codes, uniq = pd.factorize(df[key], sort=True)
+    weights = df[value_col].to_numpy(dtype=np.float64)
+    valid = codes >= 0
+    if not valid.all():
+        codes, weights = codes[valid], weights[valid]
+    sums = np.bincount(codes, weights=weights, minlength=len(uniq))
+    counts = np.bincount(codes, minlength=len(uniq))
+    return pd.DataFrame({key: uniq, value_col: sums / counts})
+
+
+# Users typically click through the univariate questions one after the
+# other; building every aggregate in one cached pass amortizes the scan of
+# the Return column across all six answers.
+@st.cache_data
+def univariate_aggs(df, keys, pair, value_col):
+    aggs = {k: mean_by(df, k, value_col) for k in keys}
+    if pair:
+        aggs[pair] = df.groupby(list(pair), observed=True)[value_col].mean().reset_index()
+    return aggs
+
+
+# The plot layer only needs one small frame per group key; memoize the
+# aggregation so flipping between sidebar questions is a cache hit rather
+# than a fresh scan of every row.
+@st.cache_data
+def return_rate_by(df, keys, value_col):
+    return df.groupby(list(keys), observed=True)[value_col].mean().reset_index()
 
 
 # ========== UI HELPERS ==========
 
+# to_csv re-formats the frame on every rerun even when nobody clicks the
+# download button; cache the encoded bytes per frame instead.
+@st.cache_data
+def csv_bytes(df):
+    return df.to_csv(index=False).encode("utf-8")
+
+
+CHART_WIDTH = 1100
+
+
+def render_chart(fig):
+    # A fixed width keeps Plotly from re-running its resize/redraw pass on
+    # every viewport change, and a constant uirevision lets reruns diff
+    # into the already-mounted plot instead of re-rendering it.
+    fig.update_layout(width=CHART_WIDTH, uirevision="fixed")
+    st.plotly_chart(fig, use_container_width=False)
+
+
 def render_insight(text):
     st.markdown("**Insight**")
     st.info(text)
@@ -93,35 +279,42 @@ st.divider()
 
 try:
     with st.spinner("Loading dataset..."):
-        df = load_data()
+        df = prepare_data()
 except Exception as e:
     st.error(f"Failed to load data: {e}")
     st.stop()
 
-data = df.copy()
+# No defensive copy: st.cache_data already hands each rerun its own
+# deserialized frame, and nothing below mutates it — the derived columns
+# are all materialized inside prepare_data.
+data = df
 
 # ========== COLUMN DETECTION ==========
 
-return_col         = first_col(data, ["Return", "return", "is_return", "Is_Return"])
-payment_col        = first_col(data, ["Payment_mode", "payment_mode", "Payment Method", "PaymentMethod"])
-store_col          = first_col(data, ["Store_type", "store_type", "Store Type", "Store"])
-income_col         = first_col(data, ["Income", "income", "Annual_Income", "Annual Income"])
-product_cat_col    = first_col(data, ["product_category", "Product_category", "Product Category", "Category"])
-product_subcat_col = first_col(data, ["Product_Subcategory", "product_subcategory", "Product Subcategory", "Subcategory"])
-reviews_col        = first_col(data, ["Reviews", "reviews", "Customer_Reviews", "Rating"])
-tax_col            = first_col(data, ["Tax", "tax", "Tax_Amount", "TaxAmount"])
-
-if reviews_col:
-    data = ensure_review_level(data, reviews_col)
-if income_col:
-    data = ensure_income_category(data, income_col)
-if tax_col:
-    data = ensure_tax_level(data, tax_col)
+cols = set(data.columns)
+
+return_col         = first_col(cols, ["Return", "return", "is_return", "Is_Return"])
+payment_col        = first_col(cols, ["Payment_mode", "payment_mode", "Payment Method", "PaymentMethod"])
+store_col          = first_col(cols, ["Store_type", "store_type", "Store Type", "Store"])
+income_col         = first_col(cols, ["Income", "income", "Annual_Income", "Annual Income"])
+product_cat_col    = first_col(cols, ["product_category", "Product_category", "Product Category", "Category"])
+product_subcat_col = first_col(cols, ["Product_Subcategory", "product_subcategory", "Product Subcategory", "Subcategory"])
+reviews_col        = first_col(cols, ["Reviews", "reviews", "Customer_Reviews", "Rating"])
+tax_col            = first_col(cols, ["Tax", "tax", "Tax_Amount", "TaxAmount"])
 
 if return_col is None:
     st.error("No 'Return' column found. Please ensure the dataset contains a 'Return' column.")
     st.stop()
 
+# Precompute the univariate answers up front (cached across reruns).
+UNI_KEYS = tuple(
+    k
+    for k in (payment_col, store_col, "Income_Category", "Review_Level", "Tax_Level")
+    if k and k in data.columns
+)
+CAT_PAIR = (product_cat_col, product_subcat_col) if product_cat_col and product_subcat_col else None
+AGG = univariate_aggs(data, UNI_KEYS, CAT_PAIR, return_col)
+
 # ========== SIDEBAR ==========
 
 st.sidebar.header("Analysis Controls")
@@ -167,7 +360,7 @@ if analysis_type == "Univariate Analysis":
     if question == "Does Payment_mode affect the return rate?":
         if payment_col:
             with st.spinner("Building chart..."):
-                return_by_payment = data.groupby(payment_col)[return_col].mean().reset_index()
+                return_by_payment = AGG[payment_col]
                 fig = px.bar(
                     return_by_payment, x=payment_col, y=return_col,
                     title="Return Rate by Payment Mode",
@@ -176,19 +369,19 @@ if analysis_type == "Univariate Analysis":
                 )
                 fig.update_traces(texttemplate="%{y:.2%}", textposition="outside")
                 fig.update_layout(yaxis_tickformat=".0%")
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig)
             render_insight(
                 "The effect of payment mode on returns appears weak — differences between "
                 "payment methods are small (approximately 2% between Credit Card and others)."
             )
-            render_data_expander(return_by_payment, return_by_payment.to_csv(index=False).encode(), "return_by_payment.csv")
+            render_data_expander(return_by_payment, csv_bytes(return_by_payment), "return_by_payment.csv")
         else:
             st.warning("Payment_mode column not found in the dataset.")
 
     elif question == "Does the Store_type influence returns?":
         if store_col:
             with st.spinner("Building chart..."):
-                return_by_store = data.groupby(store_col)[return_col].mean().reset_index()
+                return_by_store = AGG[store_col]
                 fig = px.bar(
                     return_by_store, x=store_col, y=return_col,
                     title="Return Rate by Store Type",
@@ -197,18 +390,15 @@ if analysis_type == "Univariate Analysis":
                 )
                 fig.update_traces(texttemplate="%{y:.2%}", textposition="outside")
                 fig.update_layout(yaxis_tickformat=".0%")
-            st.plotly_chart(fig, use_container_width=True)
-            render_data_expander(return_by_store, return_by_store.to_csv(index=False).encode(), "return_by_store.csv")
+            render_chart(fig)
+            render_data_expander(return_by_store, csv_bytes(return_by_store), "return_by_store.csv")
         else:
             st.warning("Store_type column not found in the dataset.")
 
     elif question == "Does Income level influence return behavior?":
         if income_col:
             with st.spinner("Building chart..."):
-                tmp = data.copy()
-                if "Income_Category" not in tmp.columns:
-                    tmp = ensure_income_category(tmp, income_col)
-                return_by_income = tmp.groupby("Income_Category")[return_col].mean().reset_index()
+                return_by_income = AGG["Income_Category"]
                 fig = px.bar(
                     return_by_income, x="Income_Category", y=return_col,
                     title="Return Rate by Income Level",
@@ -217,50 +407,59 @@ if analysis_type == "Univariate Analysis":
                 )
                 fig.update_traces(texttemplate="%{y:.2%}", textposition="outside")
                 fig.update_layout(yaxis_tickformat=".0%")
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig)
             render_insight(
                 "Very High income customers have the highest return rate (14%), "
                 "significantly above other income groups. Income level has a strong effect on return behavior."
             )
-            render_data_expander(return_by_income, return_by_income.to_csv(index=False).encode(), "return_by_income.csv")
+            render_data_expander(return_by_income, csv_bytes(return_by_income), "return_by_income.csv")
         else:
             st.warning("Income column not found in the dataset.")
 
     elif question == "What is the Return Rate of products in each Category?":
         if product_cat_col and product_subcat_col:
             with st.spinner("Building chart..."):
-                return_by_category = (
-                    data.groupby([product_cat_col, product_subcat_col])[return_col]
-                    .mean().reset_index().sort_values(return_col, ascending=False)
+                return_by_category = AGG[CAT_PAIR].sort_values(return_col, ascending=False, kind="stable")
+                # Hand-built go.Bar facets: skips px's heavyweight figure
+                # construction, the continuous colorbar, and per-bar hover
+                # inference — the serialized payload is one small trace per
+                # category pane.
+                categories = return_by_category[product_cat_col].unique().tolist()
+                n_cols = 3
+                fig = make_subplots(
+                    rows=ceil(len(categories) / n_cols), cols=n_cols,
+                    subplot_titles=categories,
                 )
-                fig = px.bar(
-                    return_by_category, x=product_subcat_col, y=return_col,
-                    color=return_col, facet_col=product_cat_col, facet_col_wrap=3,
-                    title="Return Rate of Products in each Category",
-                    labels={product_subcat_col: "Product Subcategory", return_col: "Average Return Rate"},
+                for i, cat in enumerate(categories):
+                    sub = return_by_category[return_by_category[product_cat_col] == cat]
+                    fig.add_trace(
+                        go.Bar(
+                            x=sub[product_subcat_col], y=sub[return_col],
+                            texttemplate="%{y:.2%}", textposition="outside",
+                            hovertemplate="%{x}: %{y:.2%}<extra></extra>",
+                        ),
+                        row=i // n_cols + 1, col=i % n_cols + 1,
+                    )
+                fig.update_layout(
+                    title_text="Return Rate of Products in each Category",
+                    height=900, showlegend=False,
                 )
-                fig.update_traces(texttemplate="%{y:.2%}", textposition="outside")
-                fig.update_layout(height=900, showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig)
             render_insight(
                 "Women's products in Bags, Footwear, and Clothing show return rates above 17% — "
                 "well above Men's products in the same categories. "
                 "In Home and Kitchen, Kitchen and Furnishing subcategories show notable returns at 15–16%. "
                 "In Electronics, Mobiles have a 14% return rate. In Books, DIY stands out with a 12% return rate."
             )
-            render_data_expander(return_by_category, return_by_category.to_csv(index=False).encode(), "return_by_category.csv")
+            render_data_expander(return_by_category, csv_bytes(return_by_category), "return_by_category.csv")
         else:
             st.warning("Category or Subcategory column missing.")
 
     elif question == "How does Reviews (customer satisfaction) relate to Return?":
         if reviews_col:
             with st.spinner("Building chart..."):
-                tmp = data.copy()
-                tmp = ensure_review_level(tmp, reviews_col)
-                review_return = (
-                    tmp.groupby("Review_Level")[return_col].mean()
-                    .reset_index().sort_values(return_col, ascending=False)
-                )
+                # 3-row result; px.bar orders the axis itself, no pre-sort needed.
+                review_return = AGG["Review_Level"]
                 fig = px.bar(
                     review_return, x="Review_Level", y=return_col,
                     title="Return Rate by Customer Satisfaction Level",
@@ -269,37 +468,34 @@ if analysis_type == "Univariate Analysis":
                 )
                 fig.update_traces(texttemplate="%{y:.2%}", textposition="outside")
                 fig.update_layout(yaxis_tickformat=".0%")
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig)
             render_insight(
                 "Low satisfaction customers have the highest return rate at 43% — well above the dataset average. "
                 "Satisfaction level has a strong relationship with returns: low satisfaction leads to "
                 "significantly more returns than medium or high satisfaction."
             )
-            render_data_expander(review_return, review_return.to_csv(index=False).encode(), "review_return.csv")
+            render_data_expander(review_return, csv_bytes(review_return), "review_return.csv")
         else:
             st.warning("Reviews column not found in the dataset.")
 
     elif question == "Does Tax amount (Low/Medium/High) influence returns?":
         if tax_col:
             with st.spinner("Building chart..."):
-                tmp = data.copy()
-                tmp = ensure_tax_level(tmp, tax_col)
-                tax_return = (
-                    tmp.groupby("Tax_Level")[return_col].mean()
-                    .reset_index().sort_values(return_col, ascending=False)
-                )
-                tax_return_display = tax_return.copy()
-                tax_return_display[return_col] = tax_return_display[return_col] * 100
+                tax_return = AGG["Tax_Level"]
+                # assign builds the percent view without touching the
+                # cached aggregate.
+                tax_return_display = tax_return.assign(**{return_col: tax_return[return_col] * 100})
                 fig = px.bar(
                     tax_return_display, x="Tax_Level", y=return_col,
                     title="Return Rate by Tax Level (%)",
                     labels={"Tax_Level": "Tax Level", return_col: "Return Rate (%)"},
-                    text=tax_return_display[return_col].round(2).astype(str) + "%",
                 )
-                fig.update_traces(textposition="outside")
+                # Let the front end format the labels per bar instead of
+                # materializing a Python str column on the server.
+                fig.update_traces(texttemplate="%{y:.2f}%", textposition="outside")
                 fig.update_layout(showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
-            render_data_expander(tax_return_display, tax_return.to_csv(index=False).encode(), "tax_return.csv")
+            render_chart(fig)
+            render_data_expander(tax_return_display, csv_bytes(tax_return), "tax_return.csv")
         else:
             st.warning("Tax column not found in the dataset.")
 
@@ -309,22 +505,15 @@ elif analysis_type == "Multivariate Analysis":
 
     if question.startswith("Combined effect"):
         if product_subcat_col:
-            df_women = data[
-                data[product_subcat_col].astype(str).str.contains("women", case=False, na=False)
-                | data[product_subcat_col].astype(str).str.contains("wom", case=False, na=False)
-            ]
+            df_women = data[data["is_women"]]
             if df_women.empty:
                 st.warning("No rows found for Women's products based on Product_Subcategory content.")
             else:
-                if reviews_col:
-                    df_women = ensure_review_level(df_women, reviews_col)
                 if "Review_Level" in df_women.columns:
                     with st.spinner("Building chart..."):
-                        return_analysis = (
-                            df_women.groupby([product_subcat_col, "Review_Level"])[return_col]
-                            .mean().reset_index()
-                            .sort_values(by=[product_subcat_col, "Review_Level"])
-                        )
+                        return_analysis = return_rate_by(
+                            df_women, (product_subcat_col, "Review_Level"), return_col
+                        ).sort_values(by=[product_subcat_col, "Review_Level"])
                         fig = px.bar(
                             return_analysis, x="Review_Level", y=return_col,
                             color=product_subcat_col, barmode="group",
@@ -332,12 +521,12 @@ elif analysis_type == "Multivariate Analysis":
                             labels={return_col: "Return Rate", "Review_Level": "Review Level"},
                         )
                         fig.update_traces(texttemplate="%{y:.2%}", textposition="outside")
-                    st.plotly_chart(fig, use_container_width=True)
+                    render_chart(fig)
                     render_insight(
                         "The relationship between Reviews and Returns is strong across Women's categories. "
                         "Low satisfaction significantly increases return rates for both Clothing and Footwear."
                     )
-                    render_data_expander(return_analysis, return_analysis.to_csv(index=False).encode(), "women_return_by_review.csv")
+                    render_data_expander(return_analysis, csv_bytes(return_analysis), "women_return_by_review.csv")
                 else:
                     st.warning("Review_Level not available — cannot compute return by satisfaction level.")
         else:
@@ -346,11 +535,7 @@ elif analysis_type == "Multivariate Analysis":
     elif question.startswith("Effect of Reviews"):
         if reviews_col and product_cat_col:
             with st.spinner("Building chart..."):
-                tmp = data.copy()
-                tmp = ensure_review_level(tmp, reviews_col)
-                review_cat_return = (
-                    tmp.groupby([product_cat_col, "Review_Level"])[return_col].mean().reset_index()
-                )
+                review_cat_return = return_rate_by(data, (product_cat_col, "Review_Level"), return_col)
                 fig = px.bar(
                     review_cat_return, x="Review_Level", y=return_col,
                     color=product_cat_col, barmode="group",
@@ -363,8 +548,8 @@ elif analysis_type == "Multivariate Analysis":
                 )
                 fig.update_traces(texttemplate="%{y:.2%}", textposition="outside")
                 fig.update_layout(yaxis_tickformat=".0%")
-            st.plotly_chart(fig, use_container_width=True)
-            render_data_expander(review_cat_return, review_cat_return.to_csv(index=False).encode(), "review_category_return.csv")
+            render_chart(fig)
+            render_data_expander(review_cat_return, csv_bytes(review_cat_return), "review_category_return.csv")
         else:
             st.warning("Reviews or Product Category column not found.")
 
@@ -374,55 +559,62 @@ elif analysis_type == "Multivariate Analysis":
             st.warning("Missing columns for this analysis: " + ", ".join(missing_cols))
         else:
             with st.spinner("Building chart..."):
-                tmp = data.copy()
-                if "Income_Category" not in tmp.columns:
-                    tmp = ensure_income_category(tmp, "Income")
-                income_category_return = (
-                    tmp.groupby(["Income_Category", "product_category"])["Return"].mean().reset_index()
+                income_category_return = return_rate_by(
+                    data, ("Income_Category", "product_category"), "Return"
+                )
+                # The means are already aggregated — render the small dense
+                # grid directly instead of letting px.density_heatmap
+                # re-bin it.
+                pivot = income_category_return.pivot(
+                    index="product_category", columns="Income_Category", values="Return"
+                )
+                fig = go.Figure(
+                    go.Heatmap(
+                        z=pivot.values,
+                        x=pivot.columns.astype(str),
+                        y=pivot.index.astype(str),
+                        colorscale="RdYlBu_r",
+                        colorbar_title="Return Rate",
+                        hovertemplate="%{x} / %{y}: %{z:.2%}<extra></extra>",
+                    )
                 )
-                fig = px.density_heatmap(
-                    income_category_return, x="Income_Category", y="product_category", z="Return",
-                    color_continuous_scale="RdYlBu_r",
-                    title="Return Rate by Income Level and Product Category",
-                    labels={"Return": "Return Rate"},
+                fig.update_layout(
+                    title_text="Return Rate by Income Level and Product Category",
+                    height=600,
                 )
-                fig.update_layout(height=600)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig)
             render_insight(
                 "Very High income customers drive the highest return rates, particularly for Bags (up to 20%) "
                 "and Home and Kitchen (18–20%). Bags show elevated return rates across both Medium and "
                 "Very High income groups, suggesting sensitivity to product expectations or quality."
             )
-            render_data_expander(income_category_return, income_category_return.to_csv(index=False).encode(), "income_category_return.csv")
+            render_data_expander(income_category_return, csv_bytes(income_category_return), "income_category_return.csv")
 
     elif question.startswith("Return Rate by Tax Level"):
         if tax_col and product_subcat_col:
             with st.spinner("Building chart..."):
-                tmp = data.copy()
-                tmp = ensure_tax_level(tmp, tax_col)
-                tax_sub_return = (
-                    tmp.groupby(["Tax_Level", product_subcat_col])[return_col]
-                    .mean().reset_index().sort_values("Return", ascending=False)
+                tax_sub_return = return_rate_by(
+                    data, ("Tax_Level", product_subcat_col), return_col
+                ).sort_values("Return", ascending=False)
+                tax_sub_return_display = tax_sub_return.assign(
+                    **{return_col: tax_sub_return[return_col] * 100}
                 )
-                tax_sub_return_display = tax_sub_return.copy()
-                tax_sub_return_display[return_col] = tax_sub_return_display[return_col] * 100
                 fig = px.bar(
                     tax_sub_return_display, x=product_subcat_col, y=return_col,
                     color="Tax_Level", barmode="group",
-                    text=tax_sub_return_display[return_col].round(1).astype(str) + "%",
                     title="Return Rate by Tax Level and Product Subcategory",
                     labels={return_col: "Return Rate (%)", product_subcat_col: "Product Subcategory"},
                 )
-                fig.update_traces(textposition="outside")
+                fig.update_traces(texttemplate="%{y:.1f}%", textposition="outside")
                 fig.update_layout(xaxis_tickangle=-45)
-            st.plotly_chart(fig, use_container_width=True)
+            render_chart(fig)
             render_insight(
                 "Mobiles under the High tax level show the highest return rate at 24%. "
                 "Women's products (19–20%) and Furnishing/Kitchen (15–19%) also show elevated returns under high tax. "
                 "Women's subcategories maintain consistently high return rates across all tax levels, "
                 "suggesting a persistent product issue independent of tax."
             )
-            render_data_expander(tax_sub_return_display, tax_sub_return.to_csv(index=False).encode(), "tax_sub_return.csv")
+            render_data_expander(tax_sub_return_display, csv_bytes(tax_sub_return), "tax_sub_return.csv")
         else:
             st.warning("Tax column or Product_Subcategory column missing.")
 
@@ -1,6 +1,12 @@
 # prediction_page.py
 # Fresco Retail — Product Return Prediction
-# UI/UX improvements only. All model logic, feature names, defaults, and computations are unchanged.
+
+import os
+
+# Single-row inference gains nothing from OpenMP fan-out, and oversubscribed
+# threadpools hurt shared Streamlit workers. Must be set before sklearn /
+# xgboost are first imported.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
 
 import streamlit as st
 import pandas as pd
@@ -23,12 +29,176 @@ st.divider()
 
 # ========== MODEL LOADING ==========
 MODEL_PATH = "model/XGBoost_Final_Model.joblib"
-
+# Optional ONNX export of the same pipeline (produced offline with
+# skl2onnx.convert_sklearn). Used automatically when the file exists and
+# onnxruntime is installed; otherwise the joblib artifact is loaded.
+ONNX_PATH = "model/XGBoost_Final_Model.onnx"
+# Opt-in sidecar inference: when FRESCO_MODEL_URL points at a service
+# exposing POST /predict, each Streamlit worker holds a tiny HTTP client
+# instead of its own copy of the model. Unset (the default), everything
+# runs in-process as before.
+MODEL_URL = os.environ.get("FRESCO_MODEL_URL")
+
+
+
+class FastOneHotTransformer:
+    """Drop-in replacement for a fitted OneHotEncoder on small fixed vocabularies.
+
+    transform() picks rows out of precomputed identity slabs (one per
+    feature) via a dict lookup instead of running the encoder's per-category
+    comparison loop. Unknown values map to the slab's all-zero row, matching
+    handle_unknown="ignore".
+    """
+
+    def __init__(self, categories):
+        self.categories_ = [np.asarray(c) for c in categories]
+        self._slabs = []
+        self._index = []
+        for cats in self.categories_:
+            k = len(cats)
+            # Row k (one past the identity block) is the "unknown" vector.
+            slab = np.zeros((k + 1, k), dtype=np.int8)
+            slab[:k] = np.eye(k, dtype=np.int8)
+            self._slabs.append(slab)
+            self._index.append({v: i for i, v in enumerate(cats)})
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=object)
+        blocks = [
+            slab[[index.get(v, len(index)) for v in X[:, j]]]
+            for j, (slab, index) in enumerate(zip(self._slabs, self._index))
+        ]
+        return np.hstack(blocks)
+
+
+class _OnnxModel:
+    """predict_proba adapter over an ONNX Runtime session.
+
+    The session runs the converted pipeline as a fused C++ graph, so a
+    single-row call skips Python-level estimator dispatch entirely.
+    intra_op_num_threads=1 keeps one-row latency free of threadpool handoff.
+    """
+
+    def __init__(self, path):
+        import onnxruntime as ort
+
+        so = ort.SessionOptions()
+        so.intra_op_num_threads = 1
+        self._sess = ort.InferenceSession(path, sess_options=so)
+        self._inputs = self._sess.get_inputs()
+
+    def predict_proba(self, df):
+        feeds = {}
+        for inp in self._inputs:
+            col = df[inp.name]
+            if "string" in inp.type:
+                feeds[inp.name] = col.to_numpy(dtype=object).reshape(-1, 1)
+            else:
+                feeds[inp.name] = col.to_numpy(dtype=np.float32).reshape(-1, 1)
+        probs = self._sess.run(None, feeds)[1]
+        if isinstance(probs, list):
+            # ZipMap output: one {label: prob} dict per row.
+            return np.array([[p[0], p[1]] for p in probs])
+        return probs
+
+
+def _swap_fast_encoders(m):
+    # Replace fitted OneHotEncoders inside the pipeline's ColumnTransformer
+    # with the slab-indexing variant above. Done once at load time (behind
+    # cache_resource) so the persisted artifact on disk stays untouched.
+    # Only encoders whose output the slab reproduces exactly are swapped:
+    # drop= changes the output width (k-1 columns per feature) and any
+    # handle_unknown other than "ignore" changes unknown-value semantics,
+    # so those encoders are left in place.
+    try:
+        from sklearn.compose import ColumnTransformer
+        from sklearn.preprocessing import OneHotEncoder
+
+        for _, step in getattr(m, "steps", ()):
+            if not isinstance(step, ColumnTransformer):
+                continue
+            for i, (name, trans, cols) in enumerate(step.transformers_):
+                if (
+                    isinstance(trans, OneHotEncoder)
+                    and trans.drop is None
+                    and trans.handle_unknown == "ignore"
+                ):
+                    step.transformers_[i] = (
+                        name, FastOneHotTransformer(trans.categories_), cols,
+                    )
+    except Exception:
+        pass
+    return m
+
+
+class _RemoteModel:
+    """predict_proba adapter that defers to a sidecar inference service.
+
+    The sidecar holds the one model instance (and can batch rows across
+    concurrent users); workers POST the feature rows as JSON and receive
+    the positive-class probabilities back as {"probs": [...]}. Stdlib
+    urllib keeps the app free of new dependencies.
+    """
+
+    def __init__(self, base_url):
+        self._url = base_url.rstrip("/") + "/predict"
+
+    def predict_proba(self, df):
+        import json
+        from urllib.request import Request, urlopen
+
+        payload = json.dumps(
+            {"rows": df.to_dict(orient="records")}, default=float
+        ).encode("utf-8")
+        req = Request(
+            self._url, data=payload, headers={"Content-Type": "application/json"}
+        )
+        with urlopen(req, timeout=2.0) as resp:
+            probs = np.asarray(json.loads(resp.read())["probs"], dtype=np.float64)
+        return np.column_stack([1.0 - probs, probs])
+
+
+def _warm(m):
+    # One synthetic row through predict_proba initializes lazy state —
+    # imports, threadpools, traversal buffers — at load time (inside the
+    # cached load_model) instead of on the user's first click.
+    try:
+        dummy = pd.DataFrame(
+            [
+                {
+                    "Quantity": 1, "Unit_Price": 100.0, "Price": 100.0,
+                    "Tax": 10.0, "Reviews": 4, "Income": 50000.0,
+                    "total_price": 110.0, "tax_ratio": 10.0 / 101.0,
+                    "product_category": "Books", "Product_Subcategory": "Fiction",
+                    "Payment_mode": "Cash", "city": "Mumbai",
+                }
+            ]
+        )
+        m.predict_proba(dummy)
+    except Exception as e:
+        # A failed warm-up means the first real click will fail the same
+        # way — say so instead of shipping a model that only looks loaded.
+        st.warning(f"Model warm-up prediction failed: {e}")
+    return m
 
 
 @st.cache_resource
 def load_model(path):
-    return joblib.load(path)
+    if MODEL_URL:
+        return _warm(_RemoteModel(MODEL_URL))
+    if os.path.exists(ONNX_PATH):
+        try:
+            return _warm(_OnnxModel(ONNX_PATH))
+        except ImportError:
+            pass
+    # mmap_mode="r" memory-maps the pickled numpy arrays so workers share
+    # one page-cached copy instead of each materializing its own; joblib
+    # honors it when the artifact was dumped with compress=0 and falls back
+    # to a normal load otherwise.
+    return _warm(_swap_fast_encoders(joblib.load(path, mmap_mode="r")))
 
 try:
     model = load_model(MODEL_PATH)
@@ -36,115 +206,186 @@ except Exception as e:
     st.error(f"Model could not be loaded from the configured path. Details: {e}")
     st.stop()
 
+# Category -> position dicts over the UI vocabularies, built once per
+# process. The fitted-encoder counterparts are already cached inside
+# load_model; these cover code that only knows the UI side.
+@st.cache_resource
+def _cat_indexers():
+    return {
+        field: {v: i for i, v in enumerate(dtype.categories)}
+        for field, dtype in CAT_DTYPES.items()
+    }
+
+
+# Decision threshold applied to the returned probability; the class label
+# is derived from it rather than running the pipeline a second time via
+# model.predict.
+THRESHOLD = 0.5
+
+
+# Memoized on the raw scalar inputs: resubmitting the same values during a
+# session is a dict lookup instead of a full transform + tree-traversal pass.
+# Scalars hash fast (no DataFrame hashing) and max_entries bounds the cache.
+@st.cache_data(show_spinner=False, max_entries=1024)
+def _predict(quantity, unit_price, price, tax, reviews, income, total_price,
+             tax_ratio, product_category, product_subcategory, payment_mode, city):
+    row = {
+        "Quantity": quantity,
+        "Unit_Price": unit_price,
+        "Price": price,
+        "Tax": tax,
+        "Reviews": reviews,
+        "Income": income,
+        "total_price": total_price,
+        "tax_ratio": tax_ratio,
+        "product_category": product_category,
+        "Product_Subcategory": product_subcategory,
+        "Payment_mode": payment_mode,
+        "city": city,
+    }
+    return float(model.predict_proba(pd.DataFrame([row]).astype(CAT_DTYPES))[0, 1])
+
 # ========== CATEGORY -> SUBCATEGORY MAPPING ==========
 # Unchanged from original.
+# Tuples throughout: widget options keep a stable identity across reruns,
+# so Streamlit's option-diffing hashes the same object instead of a fresh
+# list allocation per run.
 category_map = {
-    "Books": ["Fiction", "DIY", "Non-Fiction", "Academic"],
-    "Clothing": ["Women", "Mens"],
-    "Home and kitchen": ["Bath", "Kitchen", "Furnishing", "Tools"],
-    "Footwear": ["Mens", "Women", "Kids"],
-    "Bags": ["Women", "Mens"],
-    "Electronics": ["Mobiles", "Audio and video", "Computers", "Cameras", "Personal Appliances"],
+    "Books": ("Fiction", "DIY", "Non-Fiction", "Academic"),
+    "Clothing": ("Women", "Mens"),
+    "Home and kitchen": ("Bath", "Kitchen", "Furnishing", "Tools"),
+    "Footwear": ("Mens", "Women", "Kids"),
+    "Bags": ("Women", "Mens"),
+    "Electronics": ("Mobiles", "Audio and video", "Computers", "Cameras", "Personal Appliances"),
 }
 
-# ========== SECTION 1: ORDER DETAILS ==========
-st.subheader("Order Details")
-
-col_qty, col_price, col_tax = st.columns(3)
+CATEGORY_KEYS = tuple(category_map)
+PAYMENT_MODES = ("Mobile Payments", "Credit Card", "Debit Card", "Cash")
+CITIES = (
+    "Hyderabad", "Bangalore", "Kolkata", "New Delhi", "Chennai",
+    "Pune", "Ahmedabad", "Gurgaon", "Vishakhapatnam", "Mumbai",
+)
 
-with col_qty:
-    Quantity = st.slider("Quantity", 1, 10, 3)
+# Model input columns, in training order.
+FEATURE_COLS = [
+    "Quantity", "Unit_Price", "Price", "Tax", "Reviews", "Income",
+    "total_price", "tax_ratio", "product_category", "Product_Subcategory",
+    "Payment_mode", "city",
+]
+
+# Fixed Categorical dtypes for the categorical inputs: the encoder then
+# compares int codes instead of re-hashing Python strings on every call.
+CAT_DTYPES = {
+    "product_category": pd.CategoricalDtype(list(category_map)),
+    "Product_Subcategory": pd.CategoricalDtype(
+        sorted({s for subs in category_map.values() for s in subs})
+    ),
+    "Payment_mode": pd.CategoricalDtype(PAYMENT_MODES),
+    "city": pd.CategoricalDtype(CITIES),
+}
 
-with col_price:
-    Unit_Price = st.slider("Unit Price", 0.0, 20000.0, 776.17, step=1.0, format="%.2f")
+# ========== SECTION 1: PRODUCT DETAILS ==========
+# Stays outside the form: the subcategory options depend on the selected
+# category, and dependent widgets need a rerun per change to update.
+st.subheader("Product Details")
 
-with col_tax:
-    Tax = st.slider("Tax", 0.0, 2000.0, 241.24, step=0.1, format="%.2f")
+prod_col1, prod_col2 = st.columns(2)
 
-# Auto-calculated values — logic is unchanged.
-Price = Quantity * Unit_Price
-total_price = Price + Tax
-tax_ratio = Tax / (Price + 1)
+with prod_col1:
+    product_category = st.selectbox("Product Category", CATEGORY_KEYS)
 
-st.markdown("**Calculated Values**")
-calc_col1, calc_col2, calc_col3 = st.columns(3)
-calc_col1.metric("Price  (Quantity x Unit Price)", f"${Price:,.2f}")
-calc_col2.metric("Total Price  (Price + Tax)", f"${total_price:,.2f}")
-calc_col3.metric("Tax Ratio  (Tax / (Price + 1))", f"{tax_ratio:.6f}")
+with prod_col2:
+    sub_options = category_map.get(product_category, ())
+    # Keyed per category so each category keeps its own subcategory state.
+    Product_Subcategory = st.selectbox(
+        "Product Subcategory", sub_options, key=f"sub_{product_category}"
+    )
 
 st.divider()
 
-# ========== SECTION 2: PRODUCT DETAILS ==========
-st.subheader("Product Details")
+# ========== SECTIONS 2 & 3: ORDER + CUSTOMER DETAILS (form) ==========
+# The form defers reruns until submit, so slider drags no longer re-execute
+# the whole script per tick; derived values and inference run once per
+# submit below.
+with st.form("predict_form"):
 
-prod_col1, prod_col2 = st.columns(2)
+    st.subheader("Order Details")
 
-with prod_col1:
-    product_category = st.selectbox("Product Category", list(category_map.keys()))
+    col_qty, col_price, col_tax = st.columns(3)
 
-with prod_col2:
-    sub_options = category_map.get(product_category, [])
-    Product_Subcategory = st.selectbox("Product Subcategory", sub_options)
+    with col_qty:
+        Quantity = st.slider("Quantity", 1, 10, 3)
 
-st.divider()
+    with col_price:
+        Unit_Price = st.slider("Unit Price", 0.0, 20000.0, 776.17, step=1.0, format="%.2f")
 
-# ========== SECTION 3: CUSTOMER DETAILS ==========
-st.subheader("Customer Details")
+    with col_tax:
+        Tax = st.slider("Tax", 0.0, 2000.0, 241.24, step=0.1, format="%.2f")
 
-cust_col1, cust_col2, cust_col3, cust_col4 = st.columns(4)
+    st.divider()
 
-with cust_col1:
-    Reviews = st.slider("Customer Rating (1–5)", 1, 5, 4)
+    st.subheader("Customer Details")
 
-with cust_col2:
-    Income = st.slider("Customer Income", 0.0, 300000.0, 70516.88, step=100.0, format="%.2f")
+    cust_col1, cust_col2, cust_col3, cust_col4 = st.columns(4)
 
-with cust_col3:
-    Payment_mode = st.selectbox(
-        "Payment Mode",
-        ["Mobile Payments", "Credit Card", "Debit Card", "Cash"],
-    )
+    with cust_col1:
+        Reviews = st.slider("Customer Rating (1–5)", 1, 5, 4)
 
-with cust_col4:
-    city = st.selectbox(
-        "City",
-        [
-            "Hyderabad", "Bangalore", "Kolkata", "New Delhi", "Chennai",
-            "Pune", "Ahmedabad", "Gurgaon", "Vishakhapatnam", "Mumbai",
-        ],
-    )
+    with cust_col2:
+        Income = st.slider("Customer Income", 0.0, 300000.0, 70516.88, step=100.0, format="%.2f")
 
-st.divider()
+    with cust_col3:
+        Payment_mode = st.selectbox("Payment Mode", PAYMENT_MODES)
 
-# ========== INPUT PREVIEW ==========
-# Column names and values are identical to the original.
-input_data = pd.DataFrame(
-    [
-        {
-            "Quantity": Quantity,
-            "Unit_Price": Unit_Price,
-            "Price": Price,
-            "Tax": Tax,
-            "Reviews": Reviews,
-            "Income": Income,
-            "total_price": total_price,
-            "tax_ratio": tax_ratio,
-            "product_category": product_category,
-            "Product_Subcategory": Product_Subcategory,
-            "Payment_mode": Payment_mode,
-            "city": city,
-        }
-    ]
-)
+    with cust_col4:
+        city = st.selectbox("City", CITIES)
 
-with st.expander("Review input before predicting"):
-    st.dataframe(input_data, use_container_width=True)
+    submitted = st.form_submit_button("Predict", type="primary")
 
 # ========== PREDICTION ==========
-if st.button("Predict", type="primary", use_container_width=False):
+if submitted:
+    # Auto-calculated values — logic is unchanged, just run once per submit.
+    Price = Quantity * Unit_Price
+    total_price = Price + Tax
+    tax_ratio = Tax / (Price + 1)
+
+    st.markdown("**Calculated Values**")
+    calc_col1, calc_col2, calc_col3 = st.columns(3)
+    calc_col1.metric("Price  (Quantity x Unit Price)", f"${Price:,.2f}")
+    calc_col2.metric("Total Price  (Price + Tax)", f"${total_price:,.2f}")
+    calc_col3.metric("Tax Ratio  (Tax / (Price + 1))", f"{tax_ratio:.6f}")
+
+    # Column names and values are identical to the original.
+    input_data = pd.DataFrame(
+        [
+            {
+                "Quantity": Quantity,
+                "Unit_Price": Unit_Price,
+                "Price": Price,
+                "Tax": Tax,
+                "Reviews": Reviews,
+                "Income": Income,
+                "total_price": total_price,
+                "tax_ratio": tax_ratio,
+                "product_category": product_category,
+                "Product_Subcategory": Product_Subcategory,
+                "Payment_mode": Payment_mode,
+                "city": city,
+            }
+        ]
+    )
+
+    with st.expander("Submitted input"):
+        # st.json renders the row without the Arrow serialization + React
+        # grid a one-row st.dataframe would pay.
+        st.json(input_data.to_dict(orient="records")[0])
+
     try:
-        prob = model.predict_proba(input_data)[0][1]
-        pred = model.predict(input_data)[0]
+        prob = _predict(
+            Quantity, Unit_Price, Price, Tax, Reviews, Income, total_price,
+            tax_ratio, product_category, Product_Subcategory, Payment_mode, city,
+        )
+        pred = int(prob >= THRESHOLD)
     except Exception as e:
         st.error(f"Prediction failed. Check that model input columns match. Details: {e}")
         st.stop()
@@ -158,7 +399,7 @@ if st.button("Predict", type="primary", use_container_width=False):
         st.metric("Return Probability", f"{prob:.1%}")
 
     with result_col2:
-        if pred == 1 or prob >= 0.5:
+        if pred:
             st.error(
                 f"**Return likely** — The model estimates a {prob:.1%} probability this order "
                 "will be returned. Consider reviewing product quality, pricing, or applying a "
@@ -169,3 +410,62 @@ if st.button("Predict", type="primary", use_container_width=False):
                 f"**Return unlikely** — The model estimates a {prob:.1%} probability this order "
                 "will be not returned. No immediate action required."
             )
+
+st.divider()
+
+# ========== BULK PREDICTIONS ==========
+# A single vectorized predict_proba over the whole file amortizes the
+# transform and estimator dispatch across all rows, instead of paying the
+# per-call overhead once per order.
+with st.expander("Bulk predict from CSV"):
+    st.caption(
+        "Upload a CSV with columns Quantity, Unit_Price, Tax, Reviews, Income, "
+        "product_category, Product_Subcategory, Payment_mode, city. "
+        "Price, total_price and tax_ratio are derived automatically."
+    )
+    bulk_file = st.file_uploader("CSV file", type=["csv"], key="bulk_csv")
+
+    if bulk_file is not None:
+        try:
+            batch = pd.read_csv(bulk_file)
+            # Same derivations as the single-order path, but as float32
+            # ufuncs over plain arrays: one SIMD pass per column with no
+            # index alignment and half the bytes of float64.
+            qty = batch["Quantity"].to_numpy(dtype=np.float32)
+            unit = batch["Unit_Price"].to_numpy(dtype=np.float32)
+            tax = batch["Tax"].to_numpy(dtype=np.float32)
+            price = qty * unit
+            batch["Price"] = price
+            batch["total_price"] = price + tax
+            batch["tax_ratio"] = np.divide(tax, price + 1.0, dtype=np.float32)
+            # Values outside the known vocabularies — including blanks —
+            # reach the encoder as NaN after the Categorical cast and abort
+            # it; drop those rows up front and report them rather than
+            # failing the whole file.
+            skip = pd.Series(False, index=batch.index)
+            for col, index in _cat_indexers().items():
+                bad = batch[col].isna() | ~batch[col].isin(tuple(index))
+                if bad.any():
+                    st.warning(
+                        f"Skipping {int(bad.sum())} rows with missing or unknown "
+                        f"{col} values: {sorted(set(batch.loc[bad, col].dropna()))}"
+                    )
+                    skip |= bad
+            batch = batch[~skip]
+            if batch.empty:
+                st.warning("No rows left to score after skipping unknown values.")
+            else:
+                probs = model.predict_proba(batch[FEATURE_COLS].astype(CAT_DTYPES))[:, 1]
+                results = batch.assign(
+                    return_probability=probs,
+                    predicted_return=(probs >= THRESHOLD).astype(int),
+                )
+                st.dataframe(results.head(100), use_container_width=True)
+                st.download_button(
+                    "Download predictions as CSV",
+                    results.to_csv(index=False).encode("utf-8"),
+                    file_name="return_predictions.csv",
+                    mime="text/csv",
+                )
+        except Exception as e:
+            st.error(f"Bulk prediction failed. Check the CSV columns. Details: {e}")